@@ -4,228 +4,347 @@ API Testing Script for AI Predictive Maintenance System
 Tests all major endpoints and functionality
 """
 
+import asyncio
+import logging
+import importlib.util
+import aiohttp
 import requests
-import json
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
+import orjson
+import pytest
+from itertools import islice
 from datetime import datetime
 
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger("api_test")
+
 BASE_URL = "http://localhost:8000"
 
-def test_root():
+# Endpoint URLs, built once
+URL_ROOT = f"{BASE_URL}/"
+URL_EQUIPMENT = f"{BASE_URL}/api/equipment"
+URL_SENSOR = f"{BASE_URL}/api/sensor-data"
+URL_SENSOR_BATCH = f"{BASE_URL}/api/sensor-data/batch"
+URL_ALERTS_UNACK = f"{BASE_URL}/api/alerts?acknowledged=false"
+URL_PREDICTIONS = f"{BASE_URL}/api/predictions"
+URL_MAINTENANCE = f"{BASE_URL}/api/maintenance"
+URL_DASHBOARD = f"{BASE_URL}/api/dashboard-stats"
+
+def _url_equipment(equipment_id):
+    return f"{BASE_URL}/api/equipment/{equipment_id}"
+
+def _url_ack(alert_id):
+    return f"{BASE_URL}/api/alerts/{alert_id}/acknowledge"
+
+def _ok_json(response):
+    """Check the response succeeded and parse its body"""
+    if not response.ok:
+        raise AssertionError(response.status_code)
+    return orjson.loads(response.content)
+
+# (connect, read) timeout applied to every request
+REQ_TIMEOUT = (2.0, 10.0)
+
+# Shared keep-alive session so every call reuses pooled TCP connections;
+# the pool is sized for the stress test and retries ride out brief 5xx blips
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.05,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=("GET", "POST")
+    )
+))
+SESSION.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+
+# Fixed request bodies, serialized once at import
+_SENSOR_BODY = orjson.dumps({
+    "equipment_id": 1,
+    "temperature": 85.5,
+    "vibration": 7.2,
+    "pressure": 135.0,
+    "power_consumption": 92.0,
+    "efficiency": 78.0
+})
+
+_BATCH_EQUIPMENT_IDS = [3, 1, 2]
+_BATCH_BODY = orjson.dumps([
+    {
+        "equipment_id": equipment_id,
+        "temperature": 70.0,
+        "vibration": 2.5,
+        "pressure": 115.0,
+        "power_consumption": 80.0,
+        "efficiency": 93.0
+    }
+    for equipment_id in _BATCH_EQUIPMENT_IDS
+])
+
+_TASK_BODY = orjson.dumps({
+    "equipment_id": 1,
+    "task": "Test maintenance task",
+    "scheduled_date": "2024-12-25",
+    "priority": "medium"
+})
+
+@pytest.fixture(scope="session")
+def session():
+    """Shared keep-alive session, one per test worker"""
+    yield SESSION
+    SESSION.close()
+
+@pytest.fixture(scope="session")
+def equipment(session):
+    """Equipment list, fetched once per worker"""
+    response = session.get(URL_EQUIPMENT, timeout=REQ_TIMEOUT)
+    return _ok_json(response)['equipment']
+
+@pytest.fixture
+def alerts(session):
+    """Currently unacknowledged alerts"""
+    response = session.get(URL_ALERTS_UNACK, timeout=REQ_TIMEOUT)
+    return _ok_json(response)['alerts']
+
+def test_root(session):
     """Test root endpoint"""
-    print("Testing root endpoint...")
-    response = requests.get(f"{BASE_URL}/")
-    assert response.status_code == 200
-    data = response.json()
-    print(f"✓ Root endpoint: {data['message']}")
-    return True
+    logger.info("Testing root endpoint...")
+    response = session.get(URL_ROOT, timeout=REQ_TIMEOUT)
+    data = _ok_json(response)
+    logger.info("✓ Root endpoint: %s", data['message'])
 
-def test_equipment_list():
+def test_equipment_list(session):
     """Test equipment listing"""
-    print("\nTesting equipment list...")
-    response = requests.get(f"{BASE_URL}/api/equipment")
-    assert response.status_code == 200
-    data = response.json()
+    logger.info("\nTesting equipment list...")
+    response = session.get(URL_EQUIPMENT, timeout=REQ_TIMEOUT)
+    data = _ok_json(response)
     equipment_count = len(data['equipment'])
-    print(f"✓ Found {equipment_count} equipment")
-    return data['equipment']
+    logger.info("✓ Found %d equipment", equipment_count)
 
-def test_equipment_detail(equipment_id):
+def test_equipment_detail(session, equipment):
     """Test equipment detail endpoint"""
-    print(f"\nTesting equipment detail for ID {equipment_id}...")
-    response = requests.get(f"{BASE_URL}/api/equipment/{equipment_id}")
-    assert response.status_code == 200
-    data = response.json()
-    print(f"✓ Equipment: {data['equipment']['name']}")
-    return data
-
-def test_sensor_data_submission():
-    """Test sensor data submission"""
-    print("\nTesting sensor data submission...")
-    
-    sensor_data = {
-        "equipment_id": 1,
-        "temperature": 85.5,
-        "vibration": 7.2,
-        "pressure": 135.0,
-        "power_consumption": 92.0,
-        "efficiency": 78.0
-    }
+    if not equipment:
+        pytest.skip("no equipment registered")
     
-    response = requests.post(
-        f"{BASE_URL}/api/sensor-data",
-        json=sensor_data
-    )
-    assert response.status_code == 200
-    data = response.json()
-    print(f"✓ Sensor data recorded: {data['status']}")
-    print(f"  Anomaly detected: {data['anomaly_detected']}")
-    print(f"  Confidence: {data['confidence']:.2f}%")
-    return data
-
-def test_alerts():
+    equipment_id = equipment[0]['id']
+    logger.info("\nTesting equipment detail for ID %s...", equipment_id)
+    response = session.get(_url_equipment(equipment_id), timeout=REQ_TIMEOUT)
+    data = _ok_json(response)
+    logger.info("✓ Equipment: %s", data['equipment']['name'])
+
+def test_sensor_data_submission(session):
+    """Test sensor data submission"""
+    logger.info("\nTesting sensor data submission...")
+    response = session.post(URL_SENSOR, data=_SENSOR_BODY, timeout=REQ_TIMEOUT)
+    data = _ok_json(response)
+    logger.info("✓ Sensor data recorded: %s", data['status'])
+    logger.info("  Anomaly detected: %s", data['anomaly_detected'])
+    logger.info("  Confidence: %.2f%%", data['confidence'])
+
+def test_sensor_data_batch(session):
+    """Test batched sensor data submission"""
+    logger.info("\nTesting batched sensor data submission...")
+    response = session.post(URL_SENSOR_BATCH, data=_BATCH_BODY, timeout=REQ_TIMEOUT)
+    data = _ok_json(response)
+    assert [result['equipment_id'] for result in data] == _BATCH_EQUIPMENT_IDS
+    assert all(result['status'] == "success" for result in data)
+    logger.info("✓ Batch recorded: %d readings in request order", len(data))
+
+def test_alerts(alerts):
     """Test alerts endpoint"""
-    print("\nTesting alerts...")
-    response = requests.get(f"{BASE_URL}/api/alerts?acknowledged=false")
-    assert response.status_code == 200
-    data = response.json()
-    alert_count = len(data['alerts'])
-    print(f"✓ Found {alert_count} active alerts")
-    return data['alerts']
-
-def test_predictions():
+    logger.info("\nTesting alerts...")
+    logger.info("✓ Found %d active alerts", len(alerts))
+
+def test_predictions(session):
     """Test predictions endpoint"""
-    print("\nTesting predictions...")
-    response = requests.get(f"{BASE_URL}/api/predictions")
-    assert response.status_code == 200
-    data = response.json()
+    logger.info("\nTesting predictions...")
+    response = session.get(URL_PREDICTIONS, timeout=REQ_TIMEOUT)
+    data = _ok_json(response)
     prediction_count = len(data['predictions'])
-    print(f"✓ Found {prediction_count} predictions")
-    return data['predictions']
+    logger.info("✓ Found %d predictions", prediction_count)
 
-def test_maintenance_schedule():
+def test_maintenance_schedule(session):
     """Test maintenance schedule"""
-    print("\nTesting maintenance schedule...")
-    response = requests.get(f"{BASE_URL}/api/maintenance")
-    assert response.status_code == 200
-    data = response.json()
+    logger.info("\nTesting maintenance schedule...")
+    response = session.get(URL_MAINTENANCE, timeout=REQ_TIMEOUT)
+    data = _ok_json(response)
     schedule_count = len(data['schedule'])
-    print(f"✓ Found {schedule_count} scheduled maintenance tasks")
-    return data['schedule']
+    logger.info("✓ Found %d scheduled maintenance tasks", schedule_count)
 
-def test_create_maintenance_task():
+def test_create_maintenance_task(session):
     """Test creating maintenance task"""
-    print("\nTesting maintenance task creation...")
-    
-    task = {
-        "equipment_id": 1,
-        "task": "Test maintenance task",
-        "scheduled_date": "2024-12-25",
-        "priority": "medium"
-    }
-    
-    response = requests.post(
-        f"{BASE_URL}/api/maintenance",
-        json=task
-    )
-    assert response.status_code == 200
-    data = response.json()
-    print(f"✓ Maintenance task created: ID {data['task_id']}")
-    return data
+    logger.info("\nTesting maintenance task creation...")
+    response = session.post(URL_MAINTENANCE, data=_TASK_BODY, timeout=REQ_TIMEOUT)
+    data = _ok_json(response)
+    logger.info("✓ Maintenance task created: ID %s", data['task_id'])
 
-def test_dashboard_stats():
+def test_dashboard_stats(session):
     """Test dashboard statistics"""
-    print("\nTesting dashboard statistics...")
-    response = requests.get(f"{BASE_URL}/api/dashboard-stats")
-    assert response.status_code == 200
-    data = response.json()
-    print(f"✓ Dashboard stats:")
-    print(f"  Equipment online: {data['equipment_online']}")
-    print(f"  Active alerts: {data['active_alerts']}")
-    print(f"  Cost saved MTD: {data['cost_saved_mtd']}")
-    return data
-
-def test_acknowledge_alert(alert_id):
+    logger.info("\nTesting dashboard statistics...")
+    response = session.get(URL_DASHBOARD, timeout=REQ_TIMEOUT)
+    data = _ok_json(response)
+    logger.info("✓ Dashboard stats:")
+    logger.info("  Equipment online: %s", data['equipment_online'])
+    logger.info("  Active alerts: %s", data['active_alerts'])
+    logger.info("  Cost saved MTD: %s", data['cost_saved_mtd'])
+
+def test_acknowledge_alert(session, alerts):
     """Test acknowledging an alert"""
-    print(f"\nTesting alert acknowledgment for ID {alert_id}...")
-    response = requests.post(f"{BASE_URL}/api/alerts/{alert_id}/acknowledge")
-    assert response.status_code == 200
-    data = response.json()
-    print(f"✓ Alert acknowledged: {data['status']}")
-    return data
+    if not alerts:
+        pytest.skip("no unacknowledged alerts")
+    
+    alert_id = alerts[0]['id']
+    logger.info("\nTesting alert acknowledgment for ID %s...", alert_id)
+    response = session.post(_url_ack(alert_id), timeout=REQ_TIMEOUT)
+    data = _ok_json(response)
+    logger.info("✓ Alert acknowledged: %s", data['status'])
 
 def run_comprehensive_test():
-    """Run all tests"""
-    print("="*60)
-    print("AI Predictive Maintenance System - API Test Suite")
-    print("="*60)
+    """Run all tests through pytest, spread over workers when pytest-xdist is installed"""
+    logger.info("=" * 60)
+    logger.info("AI Predictive Maintenance System - API Test Suite")
+    logger.info("=" * 60)
     
     try:
-        # Test basic endpoints
-        test_root()
-        equipment = test_equipment_list()
-        
-        if equipment:
-            test_equipment_detail(equipment[0]['id'])
-        
-        # Test sensor data and ML
-        test_sensor_data_submission()
-        
-        # Wait a moment for processing
-        time.sleep(1)
-        
-        # Test analysis endpoints
-        predictions = test_predictions()
-        alerts = test_alerts()
-        test_maintenance_schedule()
-        
-        # Test dashboard
-        test_dashboard_stats()
-        
-        # Test task creation
-        test_create_maintenance_task()
-        
-        # Test alert acknowledgment
-        if alerts:
-            test_acknowledge_alert(alerts[0]['id'])
-        
-        print("\n" + "="*60)
-        print("✓ All tests passed successfully!")
-        print("="*60)
-        
-    except AssertionError as e:
-        print(f"\n✗ Test failed: {e}")
-        return False
+        SESSION.get(URL_ROOT, timeout=REQ_TIMEOUT)
     except requests.exceptions.ConnectionError:
-        print("\n✗ Connection error: Is the backend running on http://localhost:8000?")
+        logger.error("\n✗ Connection error: Is the backend running on %s?", BASE_URL)
         return False
-    except Exception as e:
-        print(f"\n✗ Unexpected error: {e}")
+    
+    # pytest captures each test's log output; -rP replays it for passing
+    # tests too (live logging does not reach back from xdist workers)
+    args = ["-q", "-rP", "--log-level=INFO", "--log-format=%(message)s", __file__]
+    if importlib.util.find_spec("xdist") is not None:
+        args = ["-n", "auto"] + args
+    
+    if pytest.main(args) != pytest.ExitCode.OK:
+        logger.error("\n✗ Test failed")
         return False
     
+    logger.info("\n" + "=" * 60)
+    logger.info("✓ All tests passed successfully!")
+    logger.info("=" * 60)
     return True
 
+STRESS_CONCURRENCY = 32
+BATCH_SIZE = 25
+PROGRESS_EVERY = 20
+
+def _batch_endpoint_available():
+    """Probe the batch endpoint with an empty batch"""
+    response = SESSION.post(URL_SENSOR_BATCH, data=b"[]", timeout=REQ_TIMEOUT)
+    return response.status_code not in (404, 405)
+
+async def _post_json(session, sem, url, payload):
+    """POST one JSON payload, returning the parsed response or None"""
+    async with sem:
+        async with session.post(
+            url,
+            data=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"}
+        ) as response:
+            if response.status != 200:
+                return None
+            return orjson.loads(await response.read())
+
+async def _stress_async(payloads, batched):
+    """Submit all payloads concurrently, bounded by STRESS_CONCURRENCY
+
+    In batched mode payloads go out BATCH_SIZE at a time to the batch
+    endpoint, which answers with per-reading results in request order.
+    """
+    count = len(payloads)
+    sem = asyncio.Semaphore(STRESS_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=64, keepalive_timeout=30)
+    
+    if batched:
+        url = URL_SENSOR_BATCH
+        jobs = [payloads[i:i + BATCH_SIZE] for i in range(0, count, BATCH_SIZE)]
+    else:
+        url = URL_SENSOR
+        jobs = payloads
+    
+    async def run(session, job):
+        try:
+            result = await _post_json(session, sem, url, job)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            logger.debug("stress request failed: %s", exc)
+            result = None
+        if not batched:
+            return [result]
+        return result if result is not None else [None] * len(job)
+    
+    results = []
+    timeout = aiohttp.ClientTimeout(sock_connect=REQ_TIMEOUT[0], sock_read=REQ_TIMEOUT[1])
+    
+    # Report progress every PROGRESS_EVERY readings, or after each batch
+    jobs_per_chunk = 1 if batched else PROGRESS_EVERY
+    
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        completed = asyncio.as_completed([run(session, job) for job in jobs])
+        for _ in range(0, len(jobs), jobs_per_chunk):
+            for task in islice(completed, jobs_per_chunk):
+                results.extend(await task)
+            logger.info("  Progress: %d/%d", len(results), count)
+    
+    return results
+
 def stress_test_sensor_data(count=100):
     """Stress test with multiple sensor readings"""
-    print(f"\nStress testing with {count} sensor readings...")
-    import random
-    
-    success_count = 0
-    anomaly_count = 0
-    
-    for i in range(count):
-        sensor_data = {
-            "equipment_id": random.randint(1, 6),
-            "temperature": 65 + random.uniform(-10, 25),
-            "vibration": 2 + random.uniform(-1, 8),
-            "pressure": 110 + random.uniform(-15, 35) if random.random() > 0.3 else None,
-            "power_consumption": 80 + random.uniform(-15, 15),
-            "efficiency": 90 + random.uniform(-15, 8)
+    logger.info("\nStress testing with %d sensor readings...", count)
+    
+    # Draw every field for all readings up front, one vectorized call each
+    rng = np.random.default_rng()
+    eq = rng.integers(1, 7, size=count)
+    temp = 65 + rng.uniform(-10, 25, size=count)
+    vib = 2 + rng.uniform(-1, 8, size=count)
+    pres = 110 + rng.uniform(-15, 35, size=count)
+    pres_mask = rng.random(count) > 0.3
+    power = 80 + rng.uniform(-15, 15, size=count)
+    eff = 90 + rng.uniform(-15, 8, size=count)
+    
+    payloads = [
+        {
+            "equipment_id": int(eq[i]),
+            "temperature": float(temp[i]),
+            "vibration": float(vib[i]),
+            "pressure": float(pres[i]) if pres_mask[i] else None,
+            "power_consumption": float(power[i]),
+            "efficiency": float(eff[i])
         }
-        
-        try:
-            response = requests.post(
-                f"{BASE_URL}/api/sensor-data",
-                json=sensor_data
-            )
-            if response.status_code == 200:
-                success_count += 1
-                if response.json()['anomaly_detected']:
-                    anomaly_count += 1
-        except:
-            pass
-        
-        if (i + 1) % 20 == 0:
-            print(f"  Progress: {i + 1}/{count}")
-    
-    print(f"✓ Stress test complete:")
-    print(f"  Successful submissions: {success_count}/{count}")
-    print(f"  Anomalies detected: {anomaly_count}")
+        for i in range(count)
+    ]
+    
+    try:
+        batched = _batch_endpoint_available()
+    except requests.exceptions.RequestException as exc:
+        logger.debug("batch endpoint probe failed: %s", exc)
+        logger.error("\n✗ Connection error: Is the backend running on %s?", BASE_URL)
+        return
+    if not batched:
+        logger.info("  Batch endpoint unavailable, submitting readings one at a time")
+    
+    results = asyncio.run(_stress_async(payloads, batched))
+    
+    success_count = sum(1 for result in results if result is not None)
+    anomaly_count = sum(1 for result in results if result and result['anomaly_detected'])
+    
+    logger.info("✓ Stress test complete:")
+    logger.info("  Successful submissions: %d/%d", success_count, count)
+    logger.info("  Anomalies detected: %d", anomaly_count)
 
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) > 1 and sys.argv[1] == "--stress":
+    # --quiet keeps only warnings and failures, so bulk runs do no console I/O
+    if "--quiet" in sys.argv[1:]:
+        logger.setLevel(logging.WARNING)
+    
+    if "--stress" in sys.argv[1:]:
         stress_test_sensor_data(100)
     else:
         run_comprehensive_test()